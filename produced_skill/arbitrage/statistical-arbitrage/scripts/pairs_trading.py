@@ -10,7 +10,7 @@ This script provides tools for:
 Prerequisites:
     uv venv .venv
     source .venv/bin/activate
-    uv pip install pandas numpy statsmodels matplotlib
+    uv pip install pandas numpy pyarrow statsmodels numba joblib matplotlib
 
 Usage:
     python pairs_trading.py --help
@@ -19,36 +19,143 @@ Usage:
 """
 
 import argparse
+import os
 import sys
+from collections import OrderedDict
+from functools import reduce
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
+import pyarrow
+import pyarrow.parquet as pq
+from joblib import Parallel, delayed
+from numba import njit
 from statsmodels.tsa.stattools import coint, adfuller
-from statsmodels.regression.linear_model import OLS
-import statsmodels.api as sm
 
 
-def load_price_data(file_path):
-    """Load price data from CSV file."""
-    df = pd.read_csv(file_path, parse_dates=['date'], index_col='date')
-    return df
+# LRU cache of cointegration_test results keyed by the pair, window_id,
+# screen_pvalue and the span of dates the pair shares, filled by
+# find_cointegrated_pairs when a window_id is given. Pairs dropped by the
+# ADF screen are cached as None.
+COINT_CACHE_SIZE = 4096
+_coint_cache = OrderedDict()
 
 
-def calculate_correlation(price_a, price_b):
-    """Calculate correlation between two price series."""
-    returns_a = price_a.pct_change().dropna()
-    returns_b = price_b.pct_change().dropna()
+def _match_tz(start, tz):
+    """Give `start` the timezone of the date column it is compared with."""
+    if start is None:
+        return None
+    if tz is not None:
+        return start.tz_localize(tz) if start.tz is None else start.tz_convert(tz)
+    if start.tz is not None:
+        raise ValueError(f"start_date {start} has a timezone but the dates "
+                         f"in the file do not")
+    return start
+
+
+def load_price_data(file_path, tail_rows=None, start_date=None):
+    """
+    Load price data from CSV file.
+    
+    Only the `date` and `close` columns are read. The first load parses the
+    CSV with the multi-threaded pyarrow parser and caches the result as
+    `<file>.parquet` next to it; later loads read that cache instead, and it
+    is rebuilt whenever the CSV is newer, the cached prices are not float64,
+    or the cache cannot be read.
+    
+    Args:
+        file_path: Path to a CSV file with `date` and `close` columns
+        tail_rows: Keep only the last N rows. Applied after loading, so the
+            whole `date`/`close` columns are still read.
+        start_date: Keep only rows on or after this date. A date without a
+            timezone is taken to be in the timezone of the file's dates.
     
-    # Align the series
-    common_idx = returns_a.index.intersection(returns_b.index)
-    return returns_a.loc[common_idx].corr(returns_b.loc[common_idx])
+    Returns:
+        DataFrame with a `close` column, indexed by date
+    """
+    csv_path = Path(file_path)
+    cache_path = csv_path.with_name(csv_path.name + '.parquet')
+    start = pd.Timestamp(start_date) if start_date is not None else None
+    
+    df = None
+    if (cache_path.exists()
+            and cache_path.stat().st_mtime >= csv_path.stat().st_mtime):
+        try:
+            schema = pq.read_schema(cache_path)
+            if schema.field('close').type == pyarrow.float64():
+                start = _match_tz(start, schema.field('date').type.tz)
+                # Parquet lets the date filter skip whole row groups
+                filters = [('date', '>=', start)] if start is not None else None
+                df = pd.read_parquet(cache_path, columns=['date', 'close'],
+                                     filters=filters)
+        except (pyarrow.ArrowInvalid, KeyError, OSError):
+            df = None  # Damaged or foreign cache: rebuild it from the CSV
+    
+    if df is None:
+        df = pd.read_csv(csv_path, engine='pyarrow', usecols=['date', 'close'],
+                         parse_dates=['date'], dtype={'close': np.float64})
+        # Write under a temporary name and rename into place, so an
+        # interrupted write never leaves a truncated cache behind
+        tmp_path = cache_path.with_name(f'{cache_path.name}.{os.getpid()}.tmp')
+        try:
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            # Read-only location: work without the cache
+            tmp_path.unlink(missing_ok=True)
+        start = _match_tz(start, df['date'].dt.tz)
+        if start is not None:
+            df = df[df['date'] >= start]
+    
+    if tail_rows is not None:
+        df = df.tail(tail_rows)
+    return df.set_index('date')
+
 
+def load_close_series(file_path, tail_rows=None, start_date=None):
+    """Load the close price series from CSV file."""
+    return load_price_data(file_path, tail_rows, start_date)['close']
 
-def cointegration_test(price_a, price_b):
+
+def common_index(indexes):
+    """
+    Intersect several date indexes.
+    
+    Sorted, duplicate-free indexes (the usual trading calendar) take a
+    merge-based np.intersect1d fast path instead of hash joins.
+    """
+    if all(idx.is_monotonic_increasing and idx.is_unique for idx in indexes):
+        values = reduce(
+            lambda x, y: np.intersect1d(x, y, assume_unique=True),
+            (idx.to_numpy() for idx in indexes)
+        )
+        return pd.Index(values, name=indexes[0].name)
+    return reduce(lambda x, y: x.intersection(y), indexes)
+
+
+def calculate_correlation(price_a, price_b):
+    """Calculate correlation between two aligned price series."""
+    a = np.asarray(price_a, dtype=np.float64)
+    b = np.asarray(price_b, dtype=np.float64)
+    returns_a = a[1:] / a[:-1] - 1
+    returns_b = b[1:] / b[:-1] - 1
+    
+    # Drop bars where either return is missing, as pandas' corr does
+    valid = np.isfinite(returns_a) & np.isfinite(returns_b)
+    return float(np.corrcoef(returns_a[valid], returns_b[valid])[0, 1])
+
+
+def cointegration_test(price_a, price_b, maxlag=None, autolag='AIC'):
     """
     Perform cointegration test between two price series.
     
+    Args:
+        price_a, price_b: Aligned price series for the two stocks
+        maxlag, autolag: Lag selection passed to adfuller. The default
+            AIC search fits one regression per candidate lag; use
+            maxlag=1, autolag=None for a cheap fixed-lag screen.
+    
     Returns:
         dict: {
             'cointegrated': bool,  # Whether the pair is cointegrated
@@ -61,14 +168,19 @@ def cointegration_test(price_a, price_b):
     """
     # Engle-Granger两步法
     # Step 1: 回归得到残差
-    X = sm.add_constant(price_b)
-    model = OLS(price_a, X).fit()
-    alpha = model.params.iloc[0]
-    beta = model.params.iloc[1]
-    residuals = model.resid
+    # 单变量回归直接用闭式解，无需构建完整的 statsmodels OLS 结果对象
+    a = np.asarray(price_a, dtype=np.float64)
+    b = np.asarray(price_b, dtype=np.float64)
+    ma = a.mean()
+    mb = b.mean()
+    cov = ((b - mb) * (a - ma)).sum()
+    var = ((b - mb) ** 2).sum()
+    beta = cov / var
+    alpha = ma - beta * mb
+    residuals = a - alpha - beta * b
     
     # Step 2: 检验残差的平稳性 (ADF检验)
-    adf_result = adfuller(residuals)
+    adf_result = adfuller(residuals, maxlag=maxlag, autolag=autolag)
     test_stat = adf_result[0]
     p_value = adf_result[1]
     
@@ -81,59 +193,161 @@ def cointegration_test(price_a, price_b):
         'test_stat': test_stat,
         'alpha': alpha,
         'beta': beta,
-        'resid_std': residuals.std(),
+        'resid_std': residuals.std(ddof=1),
         'resid_mean': residuals.mean(),
         'critical_values': critical_values
     }
 
 
-def find_cointegrated_pairs(stock_prices, threshold=0.85, min_periods=252):
+def _test_pair(name_a, name_b, price_a, price_b, screen_pvalue):
+    """
+    Run cointegration_test for one pair, returning any error instead of raising.
+    
+    A fixed-lag ADF screen runs first; only pairs with a screen p-value
+    below screen_pvalue get the full AIC lag search. Screened-out pairs
+    return None as their result.
+    """
+    try:
+        screen = cointegration_test(price_a, price_b, maxlag=1, autolag=None)
+        if screen['p_value'] >= screen_pvalue:
+            return name_a, name_b, None, None
+        return name_a, name_b, cointegration_test(price_a, price_b), None
+    except Exception as e:
+        return name_a, name_b, None, e
+
+
+def clear_cointegration_cache():
+    """Drop all cached cointegration results."""
+    _coint_cache.clear()
+
+
+def find_cointegrated_pairs(stock_prices, threshold=0.85, min_periods=252,
+                            n_jobs=-1, window_id=None, screen_pvalue=0.10,
+                            min_r2=0.5):
     """
     Find cointegrated pairs from a list of stock prices.
     
     Args:
         stock_prices: dict of {stock_name: price_series}
         threshold: minimum correlation threshold
-        min_periods: minimum periods required for testing
+        min_periods: minimum number of dates a pair must share to be tested
+        n_jobs: number of worker processes for the cointegration tests
+            (-1 uses all cores, 1 runs in-process)
+        window_id: hashable identifier of the data window, e.g.
+            (start_date, end_date). When given, cointegration results are
+            cached per pair and window, so repeated screens of the same
+            window skip the tests. A result depends only on the two
+            stocks' data, so it stays valid when other stocks join or
+            leave the universe; the pair's number of shared dates and
+            first/last shared date are part of the key as a guard against
+            a reused window_id. Call clear_cointegration_cache() if the
+            prices behind a window_id are revised.
+        screen_pvalue: p-value cutoff of the cheap lag-1 ADF screen. Pairs
+            at or above it are dropped without running the full test.
+        min_r2: minimum R² of the price-level regression; pairs below it
+            are skipped before any ADF test
     
     Returns:
         list of dict: Each dict contains pair info and cointegration results
+            for pairs that passed the screens
     """
     results = []
-    stock_names = list(stock_prices.keys())
-    
-    print(f"Testing {len(stock_names) * (len(stock_names) - 1) // 2} pairs...")
-    
-    for i in range(len(stock_names)):
-        for j in range(i + 1, len(stock_names)):
-            name_a = stock_names[i]
-            name_b = stock_names[j]
-            
-            price_a = stock_prices[name_a]
-            price_b = stock_prices[name_b]
-            
-            # Check minimum periods
-            if len(price_a) < min_periods or len(price_b) < min_periods:
-                continue
-            
-            # Calculate correlation
-            corr = calculate_correlation(price_a, price_b)
-            
-            if corr < threshold:
-                continue
-            
-            # Cointegration test
-            try:
-                coin_result = cointegration_test(price_a, price_b)
-                results.append({
-                    'stock_a': name_a,
-                    'stock_b': name_b,
-                    'correlation': corr,
-                    **coin_result
-                })
-            except Exception as e:
-                print(f"Error testing {name_a} vs {name_b}: {e}")
-                continue
+    
+    # Check minimum periods
+    stock_names = [name for name in stock_prices
+                   if len(stock_prices[name]) >= min_periods]
+    n_pairs = len(stock_names) * (len(stock_names) - 1) // 2
+    
+    if n_pairs == 0:
+        print("Testing 0 pairs...")
+        return results
+    
+    # Outer-join the universe: each pair is compared on the dates it shares,
+    # so one stock with a short history cannot truncate every other pair
+    frame = pd.concat({name: stock_prices[name] for name in stock_names}, axis=1)
+    
+    # Convert the universe once rather than once per pair it appears in
+    P = frame.to_numpy(dtype=np.float64)
+    valid = ~np.isnan(P)
+    
+    # Correlation prescreen plus R² gate, one matrix each for the whole
+    # universe instead of a pandas corr per pair. For a regression with one
+    # regressor and an intercept, R² is the squared correlation of the price
+    # levels; pairs the regression barely explains cannot pass the ADF.
+    if valid.all():
+        # Shared calendar: BLAS-backed np.corrcoef. float32 is plenty for
+        # the returns prescreen; cointegration_test still works in float64.
+        R = (P[1:] / P[:-1] - 1).astype(np.float32)
+        C = np.corrcoef(R, rowvar=False, dtype=np.float32)
+        level_r2 = np.corrcoef(P, rowvar=False) ** 2
+    else:
+        # Gaps: pairwise-complete correlations, with returns taken on each
+        # stock's own calendar
+        returns = pd.concat({name: stock_prices[name].pct_change().iloc[1:]
+                             for name in stock_names}, axis=1)
+        C = returns.corr(min_periods=max(min_periods - 1, 1)).to_numpy()
+        level_r2 = frame.corr(min_periods=min_periods).to_numpy() ** 2
+    
+    # Upper triangle only, so each pair is considered once. Pairs with too
+    # little overlap have NaN correlations and drop out here.
+    candidates = np.argwhere(np.triu((C >= threshold) & (level_r2 >= min_r2),
+                                     k=1))
+    
+    # Each pair is tested on the dates where both stocks have a price
+    pair_rows = {}
+    for i, j in candidates:
+        rows = valid[:, i] & valid[:, j]
+        if rows.sum() >= min_periods:
+            pair_rows[i, j] = rows
+    
+    print(f"Testing {len(pair_rows)} of {n_pairs} pairs...")
+    
+    tested = {}
+    pending = []
+    keys = {}
+    for (i, j), rows in pair_rows.items():
+        if window_id is None:
+            pending.append((i, j))
+            continue
+        
+        dates = frame.index[rows]
+        key = (stock_names[i], stock_names[j], window_id, screen_pvalue,
+               len(dates), dates[0], dates[-1])
+        keys[i, j] = key
+        if key in _coint_cache:
+            _coint_cache.move_to_end(key)
+            tested[i, j] = _coint_cache[key]
+        else:
+            pending.append((i, j))
+    
+    # Pairs are independent, so spread the ADF tests across processes
+    outputs = Parallel(n_jobs=n_jobs, backend='loky')(
+        delayed(_test_pair)(stock_names[i], stock_names[j],
+                            P[pair_rows[i, j], i], P[pair_rows[i, j], j],
+                            screen_pvalue)
+        for i, j in pending
+    )
+    
+    for (i, j), (name_a, name_b, coin_result, error) in zip(pending, outputs):
+        if error is not None:
+            print(f"Error testing {name_a} vs {name_b}: {error}")
+            continue
+        tested[i, j] = coin_result
+        if window_id is not None:
+            _coint_cache[keys[i, j]] = coin_result
+            if len(_coint_cache) > COINT_CACHE_SIZE:
+                _coint_cache.popitem(last=False)
+    
+    for i, j in pair_rows:
+        # Missing after an error, None when screened out
+        if tested.get((i, j)) is None:
+            continue
+        results.append({
+            'stock_a': stock_names[i],
+            'stock_b': stock_names[j],
+            'correlation': float(C[i, j]),
+            **tested[i, j]
+        })
     
     # Sort by p-value (most significant first)
     results.sort(key=lambda x: x['p_value'])
@@ -141,64 +355,284 @@ def find_cointegrated_pairs(stock_prices, threshold=0.85, min_periods=252):
     return results
 
 
+@njit(cache=True)
+def _rolling_ols(a, b, window):
+    """
+    Rolling regression of a on b with an intercept.
+    
+    Keeps running sums over the window, adding the new bar and dropping
+    the oldest one, so each slide costs O(1) instead of a full refit.
+    Bars with a missing price never enter the sums; windows containing one
+    are NaN, and later windows are unaffected.
+    
+    Args:
+        a, b: float64 price arrays (dependent and independent series)
+        window: Window length in bars
+    
+    Returns:
+        tuple: (alpha, beta, r2) arrays with one entry per full window,
+        the k-th covering bars k .. k + window - 1
+    """
+    n = a.shape[0]
+    m = max(n - window + 1, 0)
+    alpha = np.full(m, np.nan)
+    beta = np.full(m, np.nan)
+    r2 = np.full(m, np.nan)
+    
+    # Offset both series by their first complete bar to keep the sums
+    # well conditioned
+    first = -1
+    for i in range(n):
+        if np.isfinite(a[i]) and np.isfinite(b[i]):
+            first = i
+            break
+    if m == 0 or first < 0:
+        return alpha, beta, r2
+    a0 = a[first]
+    b0 = b[first]
+    
+    sx = 0.0
+    sy = 0.0
+    sxx = 0.0
+    sxy = 0.0
+    syy = 0.0
+    missing = 0  # Bars in the current window with a missing price
+    
+    for i in range(n):
+        if np.isfinite(a[i]) and np.isfinite(b[i]):
+            x = b[i] - b0
+            y = a[i] - a0
+            sx += x
+            sy += y
+            sxx += x * x
+            sxy += x * y
+            syy += y * y
+        else:
+            missing += 1
+        
+        if i >= window:
+            j = i - window
+            if np.isfinite(a[j]) and np.isfinite(b[j]):
+                x = b[j] - b0
+                y = a[j] - a0
+                sx -= x
+                sy -= y
+                sxx -= x * x
+                sxy -= x * y
+                syy -= y * y
+            else:
+                missing -= 1
+        
+        if i >= window - 1 and missing == 0:
+            k = i - window + 1
+            var_x = sxx - sx * sx / window
+            var_y = syy - sy * sy / window
+            cov_xy = sxy - sx * sy / window
+            if var_x > 0 and var_y > 0:
+                bt = cov_xy / var_x
+                beta[k] = bt
+                alpha[k] = (sy - bt * sx) / window + a0 - bt * b0
+                r2[k] = cov_xy * cov_xy / (var_x * var_y)
+    
+    return alpha, beta, r2
+
+
+def rolling_cointegrate(price_a, price_b, window=252, step=1, min_r2=0.5,
+                        screen_pvalue=0.10):
+    """
+    Rolling Engle-Granger cointegration test of one pair.
+    
+    The regression for every window comes from running sums, so only the
+    ADF tests cost more than O(1) per window. Windows whose R² is below
+    min_r2 skip the ADF entirely. The others first get a lag-1 screen and
+    then the full AIC test.
+    
+    Args:
+        price_a, price_b: Aligned price series for the two stocks
+        window: Window length in bars
+        step: Number of bars between tested windows
+        min_r2: Minimum R² of the window regression to run the ADF tests
+        screen_pvalue: p-value cutoff of the lag-1 ADF screen
+    
+    Returns:
+        DataFrame indexed by window end date with columns alpha, beta, r2,
+        p_value, test_stat and cointegrated. p_value and test_stat are NaN
+        for windows that did not reach the full test; windows containing a
+        missing price have NaN alpha, beta and r2 as well.
+    """
+    a = price_a.to_numpy(dtype=np.float64)
+    b = price_b.to_numpy(dtype=np.float64)
+    alpha, beta, r2 = _rolling_ols(a, b, window)
+    
+    ends = range(window, len(a) + 1, step)
+    p_values = np.full(len(ends), np.nan)
+    test_stats = np.full(len(ends), np.nan)
+    
+    for n, end in enumerate(ends):
+        k = end - window
+        if not r2[k] >= min_r2:
+            continue
+        
+        residuals = a[k:end] - alpha[k] - beta[k] * b[k:end]
+        if adfuller(residuals, maxlag=1, autolag=None)[1] >= screen_pvalue:
+            continue
+        
+        adf_result = adfuller(residuals)
+        test_stats[n] = adf_result[0]
+        p_values[n] = adf_result[1]
+    
+    return pd.DataFrame({
+        'alpha': alpha[::step],
+        'beta': beta[::step],
+        'r2': r2[::step],
+        'p_value': p_values,
+        'test_stat': test_stats,
+        'cointegrated': p_values < 0.05,  # 5%显著性水平
+    }, index=price_a.index[window - 1::step])
+
+
+@njit(cache=True)
+def _run_state_machine(enter_long, enter_short, exit_long, exit_short):
+    """
+    Propagate the position through precomputed entry and exit events.
+    
+    The threshold comparisons are done beforehand as vectorized NumPy
+    masks, so this Numba loop only carries the position from bar to bar.
+    
+    Args:
+        enter_long, enter_short: bool arrays, True where a flat book
+            should open a long / short spread position
+        exit_long, exit_short: bool arrays, True where an open long /
+            short spread position should be closed (exit or stop loss)
+    
+    Returns:
+        int8 array of positions (0, 1 or -1)
+    """
+    n = enter_long.shape[0]
+    out = np.zeros(n, np.int8)
+    position = 0
+    
+    for i in range(1, n):
+        if position == 0:
+            if enter_short[i]:
+                position = -1
+            elif enter_long[i]:
+                position = 1
+        elif position == 1:
+            if exit_long[i]:
+                position = 0
+        elif exit_short[i]:
+            position = 0
+        
+        out[i] = position
+    
+    return out
+
+
 def generate_trading_signals(price_a, price_b, beta, alpha, resid_std, 
                                entry_threshold=1.2, exit_threshold=-0.8,
-                               stop_loss=3.0):
+                               stop_loss=3.0, resid_mean=0.0):
     """
     Generate trading signals based on cointegration residuals.
     
     Args:
-        price_a, price_b: Price series for the two stocks
+        price_a, price_b: Aligned price series for the two stocks
         beta, alpha: Cointegration coefficients
         resid_std: Standard deviation of residuals
         entry_threshold: Entry threshold in standard deviations
         exit_threshold: Exit threshold in standard deviations
         stop_loss: Stop loss threshold in standard deviations
+        resid_mean: Mean of the cointegration residuals, as returned by
+            cointegration_test (zero up to rounding when the intercept is fit)
     
     Returns:
         DataFrame with signals and positions
     """
+    # Work on plain arrays; the series are assumed to be aligned
+    pa = price_a.to_numpy(dtype=np.float64)
+    pb = price_b.to_numpy(dtype=np.float64)
+    
     # Calculate spread (residuals)
-    spread = price_a - (alpha + beta * price_b)
+    spread = pa - (alpha + beta * pb)
     
     # Normalize by standard deviation
-    z_score = (spread - spread.mean()) / resid_std
+    z_score = (spread - resid_mean) / resid_std
+    
+    # Entry and exit events
+    # Spread too high: A is expensive, B is cheap -> short A, long B
+    enter_short = z_score > entry_threshold
+    # Spread too low: A is cheap, B is expensive -> long A, short B
+    enter_long = z_score < -entry_threshold
+    # Exit or stop loss for a long spread (long A, short B)
+    exit_long = (z_score > exit_threshold) | (z_score > stop_loss)
+    # Exit or stop loss for a short spread (short A, long B)
+    exit_short = (z_score < -exit_threshold) | (z_score < -stop_loss)
+    
+    # Generate signals (0: no position, 1: long spread, -1: short spread)
+    signal_col = _run_state_machine(enter_long, enter_short,
+                                    exit_long, exit_short)
+    
+    # Build the frame in one go instead of inserting columns one by one
+    signals = pd.DataFrame({
+        'price_a': pa,
+        'price_b': pb,
+        'spread': spread,
+        'z_score': z_score,
+        'signal': signal_col,
+    }, index=price_a.index)
     
-    # Generate signals
-    signals = pd.DataFrame(index=price_a.index)
-    signals['price_a'] = price_a
-    signals['price_b'] = price_b
-    signals['spread'] = spread
-    signals['z_score'] = z_score
-    signals['signal'] = 0  # 0: no position, 1: long spread, -1: short spread
+    return signals
+
+
+@njit(cache=True)
+def _backtest(pa, pb, sig, tc):
+    """
+    Fused backtest kernel over price and signal arrays.
     
-    position = 0
+    Position: 1 = long spread (long A, short B)
+             -1 = short spread (short A, long B)
+              0 = no position
+    The position held over bar i is the signal from bar i-1, with equal
+    capital allocated to both legs.
+    
+    Args:
+        pa, pb: float64 price arrays for the two stocks
+        sig: float64 signal array
+        tc: Transaction cost as fraction of trade value
     
-    for i in range(1, len(signals)):
-        z = z_score.iloc[i]
+    Returns:
+        tuple: (net returns, cumulative returns, total absolute position
+        change); the first bar of both return arrays is NaN
+    """
+    n = pa.shape[0]
+    net = np.empty(n)
+    cum = np.empty(n)
+    if n == 0:
+        return net, cum, 0.0
+    net[0] = np.nan
+    cum[0] = np.nan
+    acc = 1.0
+    trades = 0.0
+    
+    for i in range(1, n):
+        ra = pa[i] / pa[i - 1] - 1
+        rb = pb[i] / pb[i - 1] - 1
+        spread_ret = sig[i - 1] * (ra - rb)
         
-        if position == 0:
-            # No position, check for entry
-            if z > entry_threshold:
-                # Spread too high: A is expensive, B is cheap -> short A, long B
-                position = -1
-            elif z < -entry_threshold:
-                # Spread too low: A is cheap, B is expensive -> long A, short B
-                position = 1
-        elif position == 1:
-            # Currently long spread (long A, short B)
-            if z > exit_threshold or z > stop_loss:
-                # Exit or stop loss
-                position = 0
-        elif position == -1:
-            # Currently short spread (short A, long B)
-            if z < -exit_threshold or z < -stop_loss:
-                # Exit or stop loss
-                position = 0
+        # Subtract transaction costs
+        change = abs(sig[i] - sig[i - 1])
+        trades += change
+        nr = spread_ret - change * tc
+        net[i] = nr
         
-        signals.iloc[i, signals.columns.get_loc('signal')] = position
-    
-    return signals
+        # Missing bars are skipped, as in a NaN-aware cumprod
+        if np.isnan(nr):
+            cum[i] = np.nan
+        else:
+            acc *= 1 + nr
+            cum[i] = acc - 1
+    
+    return net, cum, trades
 
 
 def backtest_pairs_strategy(signals, transaction_cost=0.001):
@@ -212,25 +646,15 @@ def backtest_pairs_strategy(signals, transaction_cost=0.001):
     Returns:
         dict: Backtest results
     """
-    # Calculate returns
-    returns_a = signals['price_a'].pct_change()
-    returns_b = signals['price_b'].pct_change()
-    
-    # Position: 1 = long spread (long A, short B)
-    #          -1 = short spread (short A, long B)
-    #           0 = no position
-    position = signals['signal'].shift(1).fillna(0)
-    
-    # Spread returns (assuming equal capital allocation)
-    spread_returns = position * (returns_a - returns_b)
-    
-    # Subtract transaction costs
-    position_changes = signals['signal'].diff().abs()
-    costs = position_changes * transaction_cost
-    net_returns = spread_returns - costs
-    
-    # Cumulative returns
-    cumulative_returns = (1 + net_returns).cumprod() - 1
+    # Net and cumulative returns plus position changes in a single pass
+    net, cum, position_changes = _backtest(
+        signals['price_a'].to_numpy(dtype=np.float64),
+        signals['price_b'].to_numpy(dtype=np.float64),
+        signals['signal'].to_numpy(dtype=np.float64),
+        transaction_cost
+    )
+    net_returns = pd.Series(net, index=signals.index)
+    cumulative_returns = pd.Series(cum, index=signals.index)
     
     # Performance metrics
     total_return = cumulative_returns.iloc[-1]
@@ -239,7 +663,7 @@ def backtest_pairs_strategy(signals, transaction_cost=0.001):
     sharpe = annual_return / volatility if volatility > 0 else 0
     
     # Trade statistics
-    num_trades = position_changes.sum() / 2  # Each round trip is 2 changes
+    num_trades = position_changes / 2  # Each round trip is 2 changes
     
     return {
         'total_return': total_return,
@@ -257,13 +681,13 @@ def run_full_analysis(price_a_path, price_b_path, entry_threshold=1.2,
     """Run full analysis pipeline."""
     print(f"Loading data from {price_a_path} and {price_b_path}...")
     
-    price_a = load_price_data(price_a_path)['close']
-    price_b = load_price_data(price_b_path)['close']
+    price_a = load_close_series(price_a_path)
+    price_b = load_close_series(price_b_path)
     
     # Align data
-    common_idx = price_a.index.intersection(price_b.index)
-    price_a = price_a.loc[common_idx]
-    price_b = price_b.loc[common_idx]
+    dates = common_index([price_a.index, price_b.index])
+    price_a = price_a.reindex(dates)
+    price_b = price_b.reindex(dates)
     
     print(f"Loaded {len(price_a)} data points")
     
@@ -285,7 +709,8 @@ def run_full_analysis(price_a_path, price_b_path, entry_threshold=1.2,
     signals = generate_trading_signals(
         price_a, price_b,
         coin_result['beta'], coin_result['alpha'], coin_result['resid_std'],
-        entry_threshold, exit_threshold
+        entry_threshold, exit_threshold,
+        resid_mean=coin_result['resid_mean']
     )
     
     # Backtest